@@ -1,3 +1,3 @@
-from .gguf_llama import LlamaAI
+from .gguf_llama import LlamaAI, dot_q8
 
-__all__ = ['LlamaAI']
\ No newline at end of file
+__all__ = ['LlamaAI', 'dot_q8']
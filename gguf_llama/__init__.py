@@ -1,2 +1,2 @@
-from .gguf_llama import LlamaAI
-__all__ = ['LlamaAI']
\ No newline at end of file
+from .gguf_llama import LlamaAI, dot_q8
+__all__ = ['LlamaAI', 'dot_q8']
@@ -1,6 +1,107 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import shelve
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional, Union
+import numpy as np
+import llama_cpp
 from llama_cpp import Llama, LlamaTokenizer
-from util_helper.text_preprocessor import remove_list_formatting, remove_non_letters
+from util_helper.text_preprocessor import remove_list_formatting
+
+_NEWLINES_RE = re.compile(r"\n+")
+_NON_LETTERS_RE = re.compile(r"[^A-Za-z ]+")
+
+def _quantize_q8(v: np.ndarray) -> tuple:
+    """
+    Quantize a float vector to int8 with a per-vector scale.
+
+    Args:
+        v (np.ndarray): The float vector to quantize.
+
+    Returns:
+        tuple: (int8 vector, float32 scale) such that v ~= scale * vector.
+    """
+    scale = float(np.abs(v).max()) / 127.0
+    if scale == 0.0:
+        scale = 1.0
+    q = np.round(v / scale).astype(np.int8)
+    return q, np.float32(scale)
+
+def dot_q8(a: np.ndarray, sa: float, b: np.ndarray, sb: float) -> float:
+    """
+    Dot product of two int8-quantized vectors as produced by
+    create_embeddings(..., dtype="int8").
+
+    The int32 accumulation lowers to VNNI int8 dot-product instructions on
+    recent CPUs.
+
+    Args:
+        a (np.ndarray): First int8 vector.
+        sa (float): Scale of the first vector.
+        b (np.ndarray): Second int8 vector.
+        sb (float): Scale of the second vector.
+
+    Returns:
+        float: The dequantized dot product.
+    """
+    return float(sa) * float(sb) * float(np.dot(a.astype(np.int32), b.astype(np.int32)))
+
+_worker_llm = None
+
+def _pool_worker_init(model_path, n_ctx, llama_kwargs, device_queue) -> None:
+    """
+    Build the per-worker Llama instance for the multiprocess pool.
+
+    Runs once in each spawned worker. Weights are mmap'd against the same
+    gguf file, so workers share the read-only pages. When a device queue is
+    given each worker pins itself to the next listed CUDA device before
+    loading.
+    """
+    global _worker_llm
+    if device_queue is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(device_queue.get())
+    kwargs = {"embedding": False, "use_mmap": True, "use_mlock": False}
+    for k, v in llama_kwargs.items():
+        kwargs[k] = v
+    _worker_llm = Llama(model_path=model_path, verbose=False, n_ctx=n_ctx, **kwargs)
+
+def _pool_worker_infer(text, max_tokens, stop) -> dict:
+    """
+    Run one completion on the worker's Llama instance.
+    """
+    return _worker_llm(text, max_tokens=max_tokens, stop=stop)
+
+def _postprocess(output: dict, stop_at_str, include_stop_str: bool, only_string: bool) -> Union[str, dict]:
+    """
+    Turn a raw completion dict into the requested return shape.
+
+    Kept as a free function so it can run on a post-processing thread
+    without touching the model-owning thread.
+
+    Args:
+        output (dict): The raw OpenAI-style completion object.
+        stop_at_str (str): The stop string, if any.
+        include_stop_str (bool): Whether to append the stop string.
+        only_string (bool): Whether to extract just the generated text.
+
+    Returns:
+        str/dict: The generated text or the unchanged completion object.
+    """
+    if not only_string:
+        return output
+    choices = output.get('choices')
+    if not choices or 'text' not in choices[0]:
+        raise Exception("No generated text found in the inference object!")
+    text = choices[0]['text']
+    if include_stop_str and stop_at_str is not None:
+        text += stop_at_str
+    return text
 
 class LlamaAI:
     """
@@ -10,30 +111,86 @@ class LlamaAI:
         model_path (str): The path to the Llama model file.
         max_tokens (int): The maximum number of tokens to generate.
         max_input_tokens (int): The maximum number of tokens allowed in the input text.
-        llm (Llama): The loaded Llama model instance. 
+        llm (Llama): The loaded Llama model instance used for generation.
         tokenizer (LlamaTokenizer): The tokenizer for encoding/decoding text.
+        _llm_emb (Llama): Lazily created embedding-mode instance, sharing the
+            mmap'd weights with the generation instance.
         _loaded (bool): Whether the model is loaded.
         _llama_kwrgs (dict): Additional kwargs to pass when loading Llama model.
     """
 
-    def __init__(self, model_gguf_path:str, max_tokens:int, **llama_kwargs:Any) -> None:
+    _TOKEN_CACHE_MAX = 1024
+    _EMB_CACHE_MAX = 10_000
+    #single source for special-token parsing, shared by tokenize and the
+    #low-level count path so they can never disagree
+    _PARSE_SPECIAL = True
+    #SentencePiece bounds: a token never covers more than ~8 UTF-8 bytes,
+    #and never less than 1 — tune per tokenizer if needed
+    _MAX_BYTES_PER_TOKEN = 8
+    _MIN_BYTES_PER_TOKEN = 1
+
+    def __init__(self, model_gguf_path:str, max_tokens:int, tokenizer_backend:str="llama", cache_dir:Optional[str]=None, n_ctx_max:Optional[int]=None, max_in_flight:int=8, num_workers:int=1, devices:Optional[list]=None, prefix_cache_bytes:Optional[int]=None, **llama_kwargs:Any) -> None:
         """
         Initialize the LlamaAI instance.
 
         Args:
             model_gguf_path (str): Path to .gguf model file.
-            max_tokens (int): Max tokens to be processed 
+            max_tokens (int): Max tokens to be processed
+            tokenizer_backend (str): Tokenizer implementation to use, one of
+                "llama", "riptoken" or "nanotok". The fast backends are optional
+                installs and fall back to "llama" when unavailable.
+            cache_dir (str): Directory for a persistent token cache. Repeated
+                prompts are read back from disk instead of retokenized, also
+                across process restarts. None disables the disk cache.
+            n_ctx_max (int): Context size to allocate the model with. Defaults
+                to max_tokens. Later set_max_tokens calls below this value only
+                clamp max_tokens instead of reloading the model.
+            max_in_flight (int): Maximum number of queued async requests before
+                infer_async/embed_async apply backpressure.
+            num_workers (int): When > 1, spawn this many worker processes each
+                owning a Llama instance against the same mmap'd gguf, and
+                dispatch non-streaming completions to them. Each worker holds
+                its own KV cache (and VRAM when offloading), so budget
+                per-worker memory accordingly.
+            devices (list): Optional CUDA device index per worker, e.g.
+                [0, 0, 1, 1], so workers pin to distinct contexts.
+            prefix_cache_bytes (int): When set, keep a RAM cache of KV states
+                of this many bytes so prompts sharing a prefix with an earlier
+                request (chat templates, RAG system prompts) skip re-prefilling
+                the shared part. KV states are large — budget hundreds of MB.
             llama_kwrgs: Additional kwargs for Llama model compatible with llama-cpp-python BE
 
         """
         self.model_path = model_gguf_path
         self.max_tokens = max_tokens
+        self._n_ctx_max = n_ctx_max if n_ctx_max is not None else max_tokens
+        self._tokenizer_backend = tokenizer_backend
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._token_cache = shelve.open(os.path.join(cache_dir, "token_cache"))
+        else:
+            self._token_cache = None
         self._max_input_tokens = None
         self.llm = None
         self.tokenizer = None
         self._loaded = False
         self._llama_kwrgs = llama_kwargs
-        self._embeddings_mode = True
+        self._llm_emb = None
+        self._token_lru = OrderedDict()
+        self._max_in_flight = max_in_flight
+        self._req_queue = queue.Queue(maxsize=max_in_flight)
+        self._req_semaphore = None
+        self._req_loop = None
+        self._worker_thread = None
+        self._num_workers = num_workers
+        self._devices = devices
+        self._pool = None
+        self._prefix_cache_bytes = prefix_cache_bytes
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=3)
+        self._post_pool = ThreadPoolExecutor(max_workers=2)
+        self._emb_cache = OrderedDict()
+        self._tok_buf = None
+        self._templates = {}
         self.load()
 
         
@@ -45,26 +202,245 @@ class LlamaAI:
         Sets _loaded to True once complete.
         """
         print(f"Loading model from {self.model_path}...")
-        llama_kwargs = {"embedding": self._embeddings_mode}
-        for k, v in self._llama_kwrgs.items():
-            llama_kwargs[k] = v
-        self.llm = Llama(model_path=self.model_path, verbose=False, n_ctx=self.max_tokens, **llama_kwargs)
+        self.llm = self._build_llm(embedding=False)
+        if self._prefix_cache_bytes is not None:
+            self._enable_prefix_cache()
+        self._llm_emb = None
+        self._tok_buf = None
         self.tokenizer = LlamaTokenizer(self.llm)
+        if self._tokenizer_backend != "llama":
+            fast_tokenizer = self._load_fast_tokenizer(self._tokenizer_backend)
+            if fast_tokenizer is not None:
+                self.tokenizer = fast_tokenizer
+        if self._worker_thread is None:
+            self._worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self._worker_thread.start()
+        if self._num_workers > 1:
+            if self._pool is not None:
+                #the workers were built with the previous context size and
+                #would reject prompts validated against the new, larger limit
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+            ctx = multiprocessing.get_context("spawn")
+            device_queue = None
+            if self._devices is not None:
+                device_queue = ctx.Queue()
+                for device in self._devices:
+                    device_queue.put(device)
+            print(f"Starting {self._num_workers} inference worker processes...")
+            self._pool = ctx.Pool(
+                self._num_workers,
+                initializer=_pool_worker_init,
+                initargs=(self.model_path, self._n_ctx_max, self._llama_kwrgs, device_queue),
+            )
         self._loaded = True
 
-    def create_embeddings(self, text:str) -> list[float]:
+    def _worker_loop(self) -> None:
         """
-        Create embeddings for the input text.
+        Consume queued async requests on the single model-owning thread.
+
+        llama-cpp-python is not safe for concurrent calls, so all async
+        requests are serialized through this worker; results are handed back
+        to the requesting event loop via call_soon_threadsafe.
+        """
+        while True:
+            fut, loop, func, args = self._req_queue.get()
+            try:
+                result = func(*args)
+            except Exception as e:
+                callback, value = fut.set_exception, e
+            else:
+                callback, value = fut.set_result, result
+            try:
+                loop.call_soon_threadsafe(callback, value)
+            except RuntimeError:
+                #the requesting event loop is already closed (caller timed
+                #out or asyncio.run returned) — drop the result and keep
+                #serving the queue
+                pass
+
+    async def _submit(self, func, *args) -> Any:
+        """
+        Queue a call for the worker thread and await its result.
+
+        A semaphore sized to max_in_flight bounds queued requests, giving
+        callers backpressure instead of unbounded memory growth.
+
+        Args:
+            func: The bound method to run on the worker thread.
+            args: Positional arguments for the call.
+
+        Returns:
+            Any: Whatever the call returns.
+        """
+        loop = asyncio.get_running_loop()
+        if self._req_semaphore is None or self._req_loop is not loop:
+            #asyncio.Semaphore binds to the first loop that waits on it, so
+            #rebuild it when called from a new loop (e.g. a later asyncio.run)
+            self._req_semaphore = asyncio.Semaphore(self._max_in_flight)
+            self._req_loop = loop
+        async with self._req_semaphore:
+            fut = loop.create_future()
+            if func == self._infer_raw:
+                #warm the token cache while earlier requests are still generating
+                self._prefetch_pool.submit(self.tokenize, str(args[0]))
+            self._req_queue.put((fut, loop, func, args))
+            return await fut
+
+    async def infer_async(self, text:str, only_string: bool = True, stop_at_str=None, include_stop_str=True) -> Union[str, dict]:
+        """
+        Async version of infer, safe to call concurrently.
+
+        Requests are queued and executed one at a time by the worker thread
+        that owns the Llama instance, so the event loop is never blocked.
+        Post-processing of the completion runs on a separate small thread
+        pool, freeing the model thread for the next queued request as soon
+        as generation finishes.
+
+        Args:
+            Same as infer.
+
+        Returns:
+            str/dict: The generated text or OpenAI inference object.
+        """
+        output = await self._submit(self._infer_raw, text, stop_at_str)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._post_pool, _postprocess, output, stop_at_str, include_stop_str, only_string)
+
+    async def embed_async(self, text:str) -> np.ndarray:
+        """
+        Async version of create_embeddings, safe to call concurrently.
 
         Args:
             text (str): The text to create embeddings for.
         """
+        return await self._submit(self.create_embeddings, text)
+
+    def _build_llm(self, embedding: bool) -> Llama:
+        """
+        Construct a Llama instance for generation or embeddings.
+
+        Weights are mmap'd so the generation and embedding instances share
+        the same pages instead of duplicating RAM.
+
+        Args:
+            embedding (bool): Whether to build the instance in embedding mode.
+
+        Returns:
+            Llama: The constructed model instance.
+        """
+        llama_kwargs = {"embedding": embedding, "use_mmap": True, "use_mlock": False}
+        for k, v in self._llama_kwrgs.items():
+            llama_kwargs[k] = v
+        return Llama(model_path=self.model_path, verbose=False, n_ctx=self._n_ctx_max, **llama_kwargs)
+
+    def _enable_prefix_cache(self) -> None:
+        """
+        Attach a RAM-backed KV-state cache to the generation instance.
+
+        llama-cpp-python's LlamaRAMCache saves the KV state after each
+        completion and restores the longest matching token prefix on the
+        next one, so a repeated system prompt or few-shot prefix is only
+        prefilled once.
+        """
+        try:
+            from llama_cpp import LlamaRAMCache
+        except ImportError:
+            print("Prefix caching is not supported by this llama-cpp-python version, skipping.")
+            return
+        self.llm.set_cache(LlamaRAMCache(capacity_bytes=self._prefix_cache_bytes))
+
+    def _get_gen(self) -> Llama:
+        """
+        Return the generation-mode Llama instance.
+        """
         self._check_loaded()
-        if not self._embeddings_mode:
-            print("Switching to embeddings mode...")
-            self._embeddings_mode = True
-            self.load()
-        embs = self.llm.embed(text)
+        return self.llm
+
+    def _get_emb(self) -> Llama:
+        """
+        Return the embedding-mode Llama instance, creating it lazily.
+        """
+        self._check_loaded()
+        if self._llm_emb is None:
+            print("Loading embeddings model instance...")
+            self._llm_emb = self._build_llm(embedding=True)
+        return self._llm_emb
+
+    def _load_fast_tokenizer(self, backend: str):
+        """
+        Try to load a fast BPE tokenizer backend from the gguf file.
+
+        The fast backends skip llama.cpp's slow SentencePiece path. Their
+        output is verified against the llama.cpp tokenizer on a probe string
+        at load time; on any mismatch or missing install the llama.cpp
+        tokenizer is kept as the fallback.
+
+        Args:
+            backend (str): Either "riptoken" or "nanotok".
+
+        Returns:
+            The fast tokenizer instance, or None if unavailable.
+        """
+        try:
+            if backend == "riptoken":
+                import riptoken
+                fast_tokenizer = riptoken.Tokenizer.from_file(self.model_path)
+            elif backend == "nanotok":
+                import nanotok
+                fast_tokenizer = nanotok.Tokenizer.from_file(self.model_path)
+            else:
+                raise Exception(f"Unknown tokenizer backend: {backend}, use 'llama', 'riptoken' or 'nanotok'.")
+        except ImportError:
+            print(f"Tokenizer backend '{backend}' is not installed, falling back to the llama.cpp tokenizer.")
+            return None
+        probe = "Hello world, this is a tokenizer sanity check. 1234567890"
+        if fast_tokenizer.encode(probe) != self.tokenizer.encode(probe):
+            print(f"Tokenizer backend '{backend}' output differs from llama.cpp (custom pre-tokenizer?), falling back.")
+            return None
+        return fast_tokenizer
+
+    def create_embeddings(self, text:str, dtype:str="float32") -> np.ndarray:
+        """
+        Create embeddings for the input text.
+
+        Returned as a NumPy array instead of a list of boxed Python floats —
+        4 bytes per value rather than ~28, and no re-boxing in downstream
+        similarity code.
+
+        Repeat texts (e.g. the same document chunk embedded twice in a RAG
+        pipeline) are served from an in-process LRU cache keyed by content
+        hash instead of re-running the model.
+
+        Args:
+            text (str): The text to create embeddings for.
+            dtype (str): NumPy dtype of the returned vector, e.g. "float32"
+                (default) or "float16" for half the memory bandwidth. "int8"
+                quantizes with a per-vector scale for a 4x memory reduction;
+                use dot_q8 to compare quantized vectors.
+
+        Returns:
+            np.ndarray: The embedding vector, or an (int8 vector, scale)
+                tuple when dtype is "int8". Returned arrays are read-only
+                since they are shared with the cache; copy before mutating.
+        """
+        key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), dtype)
+        embs = self._emb_cache.get(key)
+        if embs is not None:
+            self._emb_cache.move_to_end(key)
+            return embs
+        #the cache hands the same array object to every caller, so mark it
+        #read-only to keep one caller's in-place edits from corrupting it
+        if dtype == "int8":
+            embs = _quantize_q8(np.asarray(self._get_emb().embed(text), dtype="float32"))
+            embs[0].setflags(write=False)
+        else:
+            embs = np.asarray(self._get_emb().embed(text), dtype=dtype)
+            embs.setflags(write=False)
+        self._emb_cache[key] = embs
+        if len(self._emb_cache) > self._EMB_CACHE_MAX:
+            self._emb_cache.popitem(last=False)
         return embs
 
     def _try_fixing_format(self, text: str, only_letters: bool = False, rem_list_formatting: bool = False) -> str:
@@ -85,15 +461,15 @@ class LlamaAI:
         print("Trying to fix formatting... this might have some undersired effects")
         changes = False
         if "\n\n" in text:
-            #split text in that place
-            core_info = text.split("\n\n")[1:]
-            text = " ".join(core_info)
+            #drop everything before the first blank line
+            text = text.split("\n\n", 1)[1]
             changes = True
-        if "\n" in text:
-            text = text.replace("\n", " ")
+        fixed = _NEWLINES_RE.sub(" ", text)
+        if fixed is not text and fixed != text:
+            text = fixed
             changes = True
         if only_letters:
-            text = remove_non_letters(text)
+            text = _NON_LETTERS_RE.sub("", text)
             changes = True
         if rem_list_formatting:
             text = remove_list_formatting(text)
@@ -121,10 +497,13 @@ class LlamaAI:
         Args:
             new_max_tokens (int): The new max tokens value.
 
-        Sets _loaded to False to trigger reloading.
+        Only triggers a reload when the new value exceeds the context size
+        the model was allocated with; otherwise the limit is just clamped.
         """
         self.max_tokens = new_max_tokens
-        self._loaded = False
+        if new_max_tokens > self._n_ctx_max:
+            self._n_ctx_max = new_max_tokens
+            self._loaded = False
    
     def _set_input_token_limit(self, new_max_input_tokens: int=None) -> None:
         """
@@ -152,25 +531,89 @@ class LlamaAI:
             new_max_input_tokens (int): New max input tokens value.
 
         Calls _adjust methods to update attributes.
-        Reloads the model after adjusting.
+        Reloads the model only if the allocated context size was exceeded.
         """
         self._set_total_token_limit(new_max_tokens)
         self._set_input_token_limit(max_input_tokens_limit)
-        self.load()
+        if not self._loaded:
+            self.load()
+
+    def _encode(self, text: str) -> list:
+        """
+        Encode the text with the loaded tokenizer.
+
+        When a cache_dir was given, the persistent disk cache is consulted
+        first and new results are written through to it.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            list: The list of tokenized tokens.
+        """
+        if self._token_cache is not None:
+            disk_key = hashlib.sha256(text.encode()).hexdigest()
+            ids = self._token_cache.get(disk_key)
+            if ids is not None:
+                return ids
+        try:
+            ids = self.tokenizer.encode(text, special=self._PARSE_SPECIAL)
+        except TypeError:
+            #fast backends take no special kwarg
+            ids = self.tokenizer.encode(text)
+        if self._token_cache is not None:
+            self._token_cache[disk_key] = ids
+            self._token_cache.sync()
+        return ids
 
     def tokenize(self, text: str) -> list:
         """
         Tokenize the input text using the loaded tokenizer.
 
+        Repeated calls with the same text are served from an in-process
+        LRU cache instead of re-running the tokenizer. The cache is keyed
+        by a blake2b digest of the text, so the prompt strings themselves
+        are not kept alive.
+
         Args:
             text (str): The text to tokenize.
-        
+
         Returns:
-            list: The list of tokenized tokens.
+            list: The list of tokenized tokens. Always a fresh copy — the
+                cached ids are shared internally, so mutating the returned
+                list is safe.
         """
-        ts = self.tokenizer.encode(text)
-        return ts
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        ids = self._token_lru.get(key)
+        if ids is not None:
+            self._token_lru.move_to_end(key)
+            return list(ids)
+        ids = self._encode(text)
+        self._token_lru[key] = ids
+        if len(self._token_lru) > self._TOKEN_CACHE_MAX:
+            self._token_lru.popitem(last=False)
+        return list(ids)
     
+    def tokenize_batch(self, texts: list) -> list:
+        """
+        Tokenize a batch of texts in one go.
+
+        Fast tokenizer backends expose a native encode_batch that crosses the
+        FFI boundary once and parallelizes internally; for the llama.cpp
+        tokenizer the batch is spread over a thread pool, which releases the
+        GIL per encode call.
+
+        Args:
+            texts (list): The texts to tokenize.
+
+        Returns:
+            list: A list of token id lists, one per input text.
+        """
+        if hasattr(self.tokenizer, "encode_batch"):
+            return self.tokenizer.encode_batch(texts)
+        with ThreadPoolExecutor() as pool:
+            return list(pool.map(self.tokenize, texts))
+
     def untokenize(self, tokens: list) -> str:
         """
         Decode a list of tokens back into a string.
@@ -187,39 +630,170 @@ class LlamaAI:
         """
         Count the number of tokens needed to tokenize the text.
 
+        Avoids materializing the token id list where the backend allows:
+        fast backends expose a native count, and the llama.cpp backend is
+        driven through the low-level C API into a reusable scratch buffer.
+
         Args:
             text (str): The text to count tokens for.
 
         Returns:
             int: The number of tokens.
         """
-        return len(self.tokenize(text))    
+        if hasattr(self.tokenizer, "count"):
+            return self.tokenizer.count(text)
+        n = self._count_tokens_raw(text)
+        if n is not None:
+            return n
+        return len(self.tokenize(text))
+
+    def _count_tokens_raw(self, text: str) -> Optional[int]:
+        """
+        Count tokens via the low-level llama_tokenize C call.
+
+        Writes into a preallocated scratch buffer instead of building a
+        Python list that is immediately discarded. Returns None when the
+        installed llama-cpp-python version exposes a different low-level
+        signature, in which case the caller falls back to tokenize().
 
-    def is_prompt_within_limit(self, text: str) -> bool:
+        Args:
+            text (str): The text to count tokens for.
+
+        Returns:
+            int/None: The number of tokens, or None if unsupported.
         """
-        Check if the text is within the max input tokens limit.
+        #llama-cpp-python >= 0.3.6 takes a llama_vocab* here instead of a
+        #llama_model*; both are void pointers to ctypes, so passing the
+        #wrong one is undefined behavior rather than a catchable error —
+        #the handle must be feature-detected, not trusted to the except
+        handle = getattr(self.llm._model, "vocab", None)
+        if callable(handle):
+            handle = handle()
+        if handle is None:
+            handle = getattr(self.llm._model, "model", None)
+        if handle is None:
+            return None
+        try:
+            if self._tok_buf is None:
+                self._tok_buf = (llama_cpp.llama_token * (self._n_ctx_max + 8))()
+            raw = text.encode("utf-8")
+            n = llama_cpp.llama_tokenize(
+                handle, raw, len(raw), self._tok_buf, len(self._tok_buf), True, self._PARSE_SPECIAL
+            )
+        except Exception:
+            return None
+        #a negative return is the required size when the buffer was too small
+        return n if n >= 0 else -n
+
+    def count_tokens_batch(self, texts: list) -> list:
+        """
+        Count tokens for a batch of texts.
 
         Args:
-            text (str): The text to check.
+            texts (list): The texts to count tokens for.
+
+        Returns:
+            list: The number of tokens per input text.
+        """
+        return [len(ids) for ids in self.tokenize_batch(texts)]
+
+    def _input_limit(self) -> int:
+        """
+        Return the effective input token limit.
+
+        Uses _max_input_tokens when set, falling back to max_tokens.
+        """
+        return self._max_input_tokens if self._max_input_tokens is not None else self.max_tokens
+
+    def _fits(self, ids: list) -> bool:
+        """
+        Check if a list of token ids is within the input token limit.
+
+        Args:
+            ids (list): The tokenized prompt.
 
-        Returns: 
+        Returns:
             bool: True if under input token limit, False otherwise.
         """
-        tcc = self.count_tokens(text)
-        print(f"Input length: {tcc} tokens")
+        return len(ids) <= self._input_limit()
+
+    def _fits_by_bytes(self, text: str) -> Optional[bool]:
+        """
+        Cheap byte-length bounds check that avoids tokenizing at all.
+
+        For natural language the token count sits between n_bytes /
+        _MAX_BYTES_PER_TOKEN and n_bytes / _MIN_BYTES_PER_TOKEN, so clearly
+        oversized or clearly small prompts can be decided without paying
+        for tokenization.
+
+        Args:
+            text (str): The text to check.
+
+        Returns:
+            bool/None: True/False when the byte length is conclusive,
+                None for the ambiguous middle band.
+        """
+        limit = self._input_limit()
+        n_bytes = len(text.encode("utf-8"))
+        if n_bytes > limit * self._MAX_BYTES_PER_TOKEN:
+            return False
+        if n_bytes < limit * self._MIN_BYTES_PER_TOKEN:
+            return True
+        return None
+
+    def is_prompt_within_limit(self, text: Union[str, list]) -> Union[bool, list]:
+        """
+        Check if the text is within the max input tokens limit.
+
+        Args:
+            text (str/list): The text to check, or a list of texts.
+
+        Returns:
+            bool/list: True if under input token limit, False otherwise.
+                For a list of texts, a boolean mask with one entry per text.
+        """
+        if isinstance(text, list):
+            return [self._fits(ids) for ids in self.tokenize_batch(text)]
+        quick = self._fits_by_bytes(text)
+        if quick is not None:
+            return quick
+        ids = self.tokenize(text)
+        print(f"Input length: {len(ids)} tokens")
         if self._max_input_tokens is not None:
-            r = self.count_tokens(text) <= self.max_tokens
             print(f"Max input length set to: {self._max_input_tokens} tokens")
         else:
-            r = self.count_tokens(text) <= self.max_tokens
             print(f"Max input length not set, using max tokens: {self.max_tokens} tokens")
-        return r
+        return self._fits(ids)
 
     def clear_input_tokens_limit(self) -> None:
         """
         Clear the max input tokens limit.
         """
         self._set_input_token_limit(None)
+
+    def close(self) -> None:
+        """
+        Flush and close the persistent token cache and stop worker pools.
+
+        Call this (or use the instance as a context manager) when done with
+        the model: the daemon worker thread keeps the instance referenced,
+        so the disk cache is never flushed by garbage collection alone.
+        """
+        if self._token_cache is not None:
+            self._token_cache.close()
+            self._token_cache = None
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._prefetch_pool.shutdown(wait=False)
+        self._post_pool.shutdown(wait=False)
+
+    def __enter__(self) -> "LlamaAI":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
     
     def infer(self, text:str, only_string: bool = True, stop_at_str=None, include_stop_str=True) -> Union[str, dict]:
         """
@@ -237,20 +811,125 @@ class LlamaAI:
         Raises an exception if the text is too long and no max tokens provided.
         Adjusts model tokens if needed to fit prompt.
         """
-        text = str(text)
+        if not isinstance(text, str):
+            text = str(text)
         self._check_loaded()
-        if not self.is_prompt_within_limit(text):
+        quick = self._fits_by_bytes(text)
+        if quick is False or (quick is None and not self._fits(self.tokenize(text))):
             raise Exception("Text is too long!")
-        else:            
-            stop_at = None if any([stop_at_str is None, stop_at_str == ""]) else stop_at_str
-            output:dict = self.llm(text, max_tokens=self.max_tokens, stop=stop_at)
-            if only_string:
-                output = self._text_from_inference_obj(output)
+        else:
+            stop_at = stop_at_str if stop_at_str else None
+            if self._pool is None and only_string:
+                #stream so queued requests can tokenize while this one generates
+                stream = self._get_gen()(text, max_tokens=self.max_tokens, stop=stop_at, stream=True)
+                output = "".join(chunk['choices'][0]['text'] for chunk in stream)
                 if include_stop_str:
                     output += stop_at_str if stop_at_str is not None else ""
-            return output
-    
-    def _text_from_inference_obj(self, answer_dict: dict) -> str:
-        if 'choices' in answer_dict and 'text' in answer_dict['choices'][0]:
-            extracted_answ = answer_dict['choices'][0]['text']
-        return extracted_answ
\ No newline at end of file
+                return output
+            output = self._generate(text, stop_at)
+            return _postprocess(output, stop_at_str, include_stop_str, only_string)
+
+    def _tokenize_continuation(self, text: str) -> list:
+        """
+        Tokenize text that continues an existing token sequence.
+
+        Unlike tokenize, no BOS token is prepended, so the result can be
+        concatenated after already-tokenized template parts.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            list: The list of tokenized tokens, without a leading BOS.
+        """
+        try:
+            return self.tokenizer.encode(text, add_bos=False)
+        except TypeError:
+            ids = self.tokenize(text)
+            if ids and ids[0] == self.llm.token_bos():
+                ids = ids[1:]
+            return ids
+
+    def register_template(self, name: str, prefix: str, suffix: str = "") -> None:
+        """
+        Pre-tokenize the static parts of a prompt template.
+
+        The prefix and suffix are tokenized once here; infer_template then
+        only tokenizes the variable user text per call and concatenates the
+        id lists, skipping re-tokenization of the static parts entirely.
+
+        Args:
+            name (str): Name to register the template under.
+            prefix (str): Static text placed before the user text.
+            suffix (str): Static text placed after the user text.
+        """
+        self._check_loaded()
+        prefix_ids = self.tokenize(prefix)
+        suffix_ids = self._tokenize_continuation(suffix) if suffix else []
+        self._templates[name] = (prefix_ids, suffix_ids)
+
+    def infer_template(self, name: str, user_text: str, only_string: bool = True, stop_at_str=None, include_stop_str=True) -> Union[str, dict]:
+        """
+        Generate inference text for a registered prompt template.
+
+        Args:
+            name (str): Name of a template added with register_template.
+            user_text (str): The variable text inserted into the template.
+            only_string (bool): Whether to return just text or OpenAI object.
+            stop_at_str (str): The string to stop at.
+            include_stop_str (bool): Whether to include the stop string in the output.
+
+        Returns:
+            str/dict: The generated text or OpenAI inference object.
+
+        Raises an exception for unknown templates or over-limit prompts.
+        """
+        if name not in self._templates:
+            raise Exception(f"Unknown template '{name}'! Register it with register_template first.")
+        self._check_loaded()
+        prefix_ids, suffix_ids = self._templates[name]
+        ids = prefix_ids + self._tokenize_continuation(str(user_text)) + suffix_ids
+        if not self._fits(ids):
+            raise Exception("Text is too long!")
+        stop_at = stop_at_str if stop_at_str else None
+        output = self._get_gen()(ids, max_tokens=self.max_tokens, stop=stop_at)
+        return _postprocess(output, stop_at_str, include_stop_str, only_string)
+
+    def _generate(self, text: str, stop_at) -> dict:
+        """
+        Run one non-streaming completion, via the process pool when enabled.
+
+        Args:
+            text (str): The prompt text.
+            stop_at (str): The stop string, or None.
+
+        Returns:
+            dict: The raw OpenAI-style completion object.
+        """
+        if self._pool is not None:
+            return self._pool.apply_async(_pool_worker_infer, (text, self.max_tokens, stop_at)).get()
+        return self._get_gen()(text, max_tokens=self.max_tokens, stop=stop_at)
+
+    def _infer_raw(self, text, stop_at_str) -> dict:
+        """
+        Validate the prompt and run a completion, returning the raw object.
+
+        Used by infer_async so post-processing can happen off the
+        model-owning worker thread.
+
+        Args:
+            text (str): The prompt text.
+            stop_at_str (str): The stop string, if any.
+
+        Returns:
+            dict: The raw OpenAI-style completion object.
+
+        Raises an exception if the text is over the input token limit.
+        """
+        if not isinstance(text, str):
+            text = str(text)
+        self._check_loaded()
+        quick = self._fits_by_bytes(text)
+        if quick is False or (quick is None and not self._fits(self.tokenize(text))):
+            raise Exception("Text is too long!")
+        return self._generate(text, stop_at_str if stop_at_str else None)
\ No newline at end of file